@@ -3,8 +3,30 @@ from enum import Enum
 import matplotlib.pyplot as plt
 import numpy as np
 
+try:
+    import numba
+except ImportError:  # numba is optional; the NumPy planner is used without it
+    numba = None
+
+prange = range if numba is None else numba.prange
+
 show_animation = True
 
+# LLVM fast-math flags for the kernels. ninf and nnan are left out because the
+# kernels use inf as the cost of a collision and of a pruned candidate.
+FASTMATH_FLAGS = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+def njit(func=None, **options):
+    """
+    Compile func with numba.njit(cache=True, fastmath=FASTMATH_FLAGS) when numba
+    is installed, otherwise leave it as plain Python.
+    """
+    if func is None:
+        return lambda f: njit(f, **options)
+    if numba is None:
+        return func
+    return numba.njit(cache=True, fastmath=FASTMATH_FLAGS, **options)(func)
+
 def dwa_control(x, config, goal, ob):
     dw = calc_dynamic_window(x, config)
     u, trajectory = calc_control_and_trajectory(x, dw, config, goal, ob)
@@ -19,11 +41,12 @@ class Config:
         # Robot parameters (updated for bicycle model)
         self.max_speed = 1.0  # [m/s]
         self.min_speed = -0.5  # [m/s]
-        self.max_steering_angle = 30.0 * math.pi / 180.0  # [rad] Max steering angle
+        self._max_steering_angle = 30.0 * math.pi / 180.0  # [rad] Max steering angle
         self.max_accel = 0.2  # [m/ss]
         self.max_steering_rate = 20.0 * math.pi / 180.0  # [rad/s] Max steering change rate
         self.v_resolution = 0.01  # [m/s]
-        self.steering_resolution = 1.0 * math.pi / 180.0  # [rad]
+        self._steering_resolution = 1.0 * math.pi / 180.0  # [rad]
+        self._update_steering_grid()
         self.dt = 0.1  # [s] Time tick
         self.predict_time = 3.0  # [s]
         self.to_goal_cost_gain = 0.15
@@ -38,6 +61,12 @@ class Config:
         self.ob = np.array([[-1, -1], [0, 2], [4.0, 2.0], [5.0, 4.0], [5.0, 5.0],
                             [5.0, 6.0], [5.0, 9.0], [8.0, 9.0], [7.0, 9.0], [8.0, 10.0],
                             [9.0, 11.0], [12.0, 13.0], [12.0, 12.0], [15.0, 15.0], [13.0, 13.0]])
+        self.use_numba = numba is not None  # Run the planner through the compiled kernels
+        self.num_threads = None  # Planner threads (set to the physical core count); None keeps numba's default
+        self._search_grid = None  # Last (window, samples) pair from search_grid
+        self.cull_min_candidates = 64  # Smallest search grid worth culling obstacles for
+        self.prune_min_candidates = 64  # Smallest search grid worth the branch and bound for
+        self.render_every = 10  # Redraw the animation every n simulation steps
 
     @property
     def robot_type(self):
@@ -49,26 +78,91 @@ class Config:
             raise TypeError("robot_type must be an instance of RobotType")
         self._robot_type = value
 
+    @property
+    def max_steering_angle(self):
+        return self._max_steering_angle
+
+    @max_steering_angle.setter
+    def max_steering_angle(self, value):
+        self._max_steering_angle = value
+        self._update_steering_grid()
+
+    @property
+    def steering_resolution(self):
+        return self._steering_resolution
+
+    @steering_resolution.setter
+    def steering_resolution(self, value):
+        self._steering_resolution = value
+        self._update_steering_grid()
+
+    def _update_steering_grid(self):
+        # The last sample stays at or below max_steering_angle when the resolution does not divide it
+        n_steering = int(math.floor(2 * self.max_steering_angle / self.steering_resolution + 1e-6)) + 1
+        self.delta_grid = (-self.max_steering_angle
+                           + self.steering_resolution * np.arange(n_steering))  # [rad] Steering samples
+        self.tan_table = np.tan(self.delta_grid)  # tan of each delta_grid sample
+        self._search_grid = None  # Cached samples index the old grid
+
+    def search_grid(self, dw):
+        """
+        Flattened (v, delta, tan(delta)) samples of the dynamic window dw, v-major.
+        The samples are reused as long as dw and the grid resolutions do not change
+        between ticks.
+        """
+        # Both bounds of each axis are reachable, so the samples span the closed
+        # window: the last speed may land on dw[1] and the last steering angle is dw[3]
+        n_v = max(int(math.floor((dw[1] - dw[0]) / self.v_resolution + 1e-6)) + 1, 0)
+        if dw[2] <= dw[3]:
+            steering = slice(steering_index(dw[2], self), steering_index(dw[3], self) + 1)
+        else:
+            steering = slice(0, 0)
+        window = (dw[0], n_v, self.v_resolution, steering.start, steering.stop)
+        if self._search_grid is not None and self._search_grid[0] == window:
+            return self._search_grid[1]
+
+        vs = dw[0] + self.v_resolution * np.arange(n_v)
+        ds = self.delta_grid[steering]
+        samples = (np.repeat(vs, ds.size), np.tile(ds, vs.size),
+                   np.tile(self.tan_table[steering], vs.size))
+        self._search_grid = (window, samples)
+        return samples
+
+    @property
+    def ob(self):
+        return self._ob
+
+    @ob.setter
+    def ob(self, value):
+        # Read-only so that ox and oy cannot silently go stale; assign a new array instead
+        self._ob = np.array(value, dtype=float)
+        self._ob.flags.writeable = False
+        # Contiguous per-axis copies for the distance loops; float32 is plenty at meter scale
+        self.ox = np.ascontiguousarray(self._ob[:, 0], dtype=np.float32)
+        self.oy = np.ascontiguousarray(self._ob[:, 1], dtype=np.float32)
+
+    @property
+    def n_steps(self):
+        """Integer rollout length; rollouts hold n_steps + 1 poses including the start."""
+        return int(round(self.predict_time / self.dt))
+
+    @property
+    def kernel_params(self):
+        """Plain tuple of the parameters the compiled kernels need, in _calc_final_costs order."""
+        return (self.dt, self.wheelbase, self.n_steps,
+                self.to_goal_cost_gain, self.speed_cost_gain, self.obstacle_cost_gain,
+                self.max_speed, self.robot_type == RobotType.rectangle,
+                self.robot_radius, self.robot_length, self.robot_width)
+
 config = Config()
 
-def motion(x, u, dt, wheelbase):
+def motion(x, v, delta, dt, wheelbase):
     """
     Bicycle model motion: [x, y, theta, v, delta]
-    u = [v, delta] (velocity, steering angle)
+    v, delta: velocity and steering angle commands
     """
-    x_new = x.copy()
-    v = u[0]  # Velocity
-    delta = u[1]  # Steering angle
-    theta = x[2]  # Yaw angle
-
-    # Bicycle model equations
-    x_new[0] += v * math.cos(theta) * dt  # x position
-    x_new[1] += v * math.sin(theta) * dt  # y position
-    x_new[2] += (v / wheelbase) * math.tan(delta) * dt  # yaw (theta)
-    x_new[3] = v  # Update velocity
-    x_new[4] = delta  # Update steering angle
-
-    return x_new
+    x_new, y_new, theta_new = _motion_s(x[0], x[1], x[2], v, math.tan(delta), dt, wheelbase)
+    return np.array([x_new, y_new, theta_new, v, delta])
 
 def calc_dynamic_window(x, config):
     """
@@ -78,84 +172,296 @@ def calc_dynamic_window(x, config):
     Vd = [x[3] - config.max_accel * config.dt, x[3] + config.max_accel * config.dt,
           x[4] - config.max_steering_rate * config.dt, x[4] + config.max_steering_rate * config.dt]
     dw = [max(Vs[0], Vd[0]), min(Vs[1], Vd[1]), max(Vs[2], Vd[2]), min(Vs[3], Vd[3])]
+    # Shrink the steering bounds onto config.delta_grid, so no sample breaks the
+    # steering rate limit; an empty window (x[4] past the steering limits) stays empty
+    if dw[2] <= dw[3]:
+        last = config.delta_grid.size - 1
+        lower = math.ceil((dw[2] + config.max_steering_angle) / config.steering_resolution - 1e-6)
+        upper = math.floor((dw[3] + config.max_steering_angle) / config.steering_resolution + 1e-6)
+        dw[2] = config.delta_grid[min(max(lower, 0), last)]
+        dw[3] = config.delta_grid[min(max(upper, 0), last)]
     return dw
 
+def obstacle_arrays(ob, config):
+    """Contiguous float32 (ox, oy) for the obstacles ob, reusing config's copies of config.ob."""
+    if ob is config.ob:
+        return config.ox, config.oy
+    ob = np.asarray(ob)
+    return (np.ascontiguousarray(ob[:, 0], dtype=np.float32),
+            np.ascontiguousarray(ob[:, 1], dtype=np.float32))
+
+def cull_obstacles(x, v, ox, oy, config):
+    """
+    Keep only the obstacles that can affect some candidate's cost this tick.
+    Every rollout stays within reach = max|v| * n_steps * dt of x, so an obstacle
+    farther than the nearest one plus 2 * reach is never the closest, and one
+    farther than reach plus the robot's collision extent is never hit.
+    """
+    if ox.size == 0:
+        return ox, oy
+    reach = np.abs(v).max() * config.n_steps * config.dt
+    if config.robot_type == RobotType.rectangle:
+        hit_radius = math.hypot(config.robot_length / 2, config.robot_width / 2)
+    else:
+        hit_radius = config.robot_radius
+    d = np.hypot(ox - x[0], oy - x[1])
+    keep = d <= max(d.min() + 2 * reach, reach + hit_radius)
+    return ox[keep], oy[keep]
+
+def steering_index(delta, config):
+    """Index of the config.delta_grid sample nearest to the steering angle delta."""
+    return int(round((delta + config.max_steering_angle) / config.steering_resolution))
+
 def predict_trajectory(x_init, v, delta, config):
-    x = np.array(x_init)
-    trajectory = np.array(x)
-    time = 0
-    while time <= config.predict_time:
-        x = motion(x, [v, delta], config.dt, config.wheelbase)
-        trajectory = np.vstack((trajectory, x))
-        time += config.dt
-    return trajectory
+    return _predict_trajectory(np.asarray(x_init, dtype=float), v, delta,
+                               config.dt, config.wheelbase, config.n_steps)
+
+def predict_trajectories(x_init, v, delta, config, tan_delta=None):
+    """
+    Roll out every (v, delta) pair at once with the bicycle model.
+    v and delta are arrays of shape (K,); returns a (K, T, 5) trajectory tensor.
+    tan_delta, when given, holds precomputed np.tan(delta) values.
+
+    With v and delta held constant the robot drives a circular arc, so every
+    pose is evaluated in closed form instead of integrating step by step.
+    """
+    if tan_delta is None:
+        tan_delta = np.tan(delta)
+    n_steps = config.n_steps
+    t = config.dt * np.arange(n_steps + 1)
+    half_turn = 0.5 * (v * tan_delta / config.wheelbase)[:, None] * t  # (K, T)
+    # Chord of the arc driven in time t; np.sinc keeps it exact for straight lines
+    chord = v[:, None] * t * np.sinc(half_turn / np.pi)
+    heading = x_init[2] + half_turn  # Direction of the chord
+
+    trajectories = np.empty((v.size, n_steps + 1, 5))
+    trajectories[..., 0] = x_init[0] + chord * np.cos(heading)
+    trajectories[..., 1] = x_init[1] + chord * np.sin(heading)
+    trajectories[..., 2] = x_init[2] + 2 * half_turn
+    trajectories[:, 0, 3:] = x_init[3:]
+    trajectories[:, 1:, 3] = v[:, None]
+    trajectories[:, 1:, 4] = delta[:, None]
+    return trajectories
 
 def calc_control_and_trajectory(x, dw, config, goal, ob):
-    x_init = x[:]
-    min_cost = float("inf")
-    best_u = [0.0, 0.0]
-    best_trajectory = np.array([x])
-
-    for v in np.arange(dw[0], dw[1], config.v_resolution):
-        for delta in np.arange(dw[2], dw[3], config.steering_resolution):
-            trajectory = predict_trajectory(x_init, v, delta, config)
-            to_goal_cost = config.to_goal_cost_gain * calc_to_goal_cost(trajectory, goal)
-            speed_cost = config.speed_cost_gain * (config.max_speed - trajectory[-1, 3])
-            ob_cost = config.obstacle_cost_gain * calc_obstacle_cost(trajectory, ob, config)
-            final_cost = to_goal_cost + speed_cost + ob_cost
-
-            if min_cost >= final_cost:
-                min_cost = final_cost
-                best_u = [v, delta]
-                best_trajectory = trajectory
-                if abs(best_u[0]) < config.robot_stuck_flag_cons and abs(x[3]) < config.robot_stuck_flag_cons:
-                    best_u[1] = -config.max_steering_angle  # Avoid getting stuck
-
-    return best_u, best_trajectory
-
-def calc_obstacle_cost(trajectory, ob, config):
-    ox = ob[:, 0]
-    oy = ob[:, 1]
-    dx = trajectory[:, 0] - ox[:, None]
-    dy = trajectory[:, 1] - oy[:, None]
-    r = np.hypot(dx, dy)
+    v, delta, tan_delta = config.search_grid(dw)
+    if v.size == 0:
+        return [0.0, 0.0], np.array([x])
+    ox, oy = obstacle_arrays(ob, config)
+    # On small grids the culling costs more than the rollouts it shortens
+    if v.size >= config.cull_min_candidates:
+        ox, oy = cull_obstacles(x, v, ox, oy, config)
+
+    # Branch and bound: the fastest speed sample (the last n_first candidates) is
+    # scored first, then any candidate whose speed cost plus cost_floor already
+    # exceeds the best cost so far is skipped and left at inf. The speed cost grows
+    # as v drops, so this prunes the slow tail of the grid. Small grids are scored
+    # in full, since there the bound costs more than it saves.
+    if v.size >= config.prune_min_candidates:
+        n_first = np.count_nonzero(v == v[-1])
+        cost_floor = calc_cost_floor(x, ox, oy, config)
+    else:
+        n_first, cost_floor = v.size, 0.0
+    if config.use_numba:
+        if config.num_threads is not None:
+            numba.set_num_threads(config.num_threads)
+        final_cost = _calc_final_costs(np.asarray(x, dtype=float), v, tan_delta,
+                                       float(goal[0]), float(goal[1]), ox, oy,
+                                       n_first, cost_floor, config.kernel_params)
+    else:
+        final_cost = np.full(v.size, np.inf)
+        first = slice(v.size - n_first, v.size)
+        final_cost[first] = calc_final_costs(x, v[first], delta[first], tan_delta[first],
+                                             goal, ox, oy, config)
+        if n_first < v.size:
+            speed_cost = config.speed_cost_gain * (config.max_speed - v[:-n_first])
+            rest = np.flatnonzero(speed_cost + cost_floor <= final_cost[first].min())
+            final_cost[rest] = calc_final_costs(x, v[rest], delta[rest], tan_delta[rest],
+                                                goal, ox, oy, config)
+
+    # Ties go to the last candidate in (v, delta) scan order
+    best = final_cost.size - 1 - np.argmin(final_cost[::-1])
+    best_v = float(v[best])
+    best_delta = float(delta[best])
+    best_trajectory = predict_trajectory(x, best_v, best_delta, config)
+    if abs(best_v) < config.robot_stuck_flag_cons and abs(x[3]) < config.robot_stuck_flag_cons:
+        best_delta = -config.max_steering_angle  # Avoid getting stuck
+
+    return [best_v, best_delta], best_trajectory
+
+def calc_final_costs(x, v, delta, tan_delta, goal, ox, oy, config):
+    """Final cost of each (v, delta) candidate, evaluated with NumPy."""
+    trajectories = predict_trajectories(x, v, delta, config, tan_delta)
+    to_goal_cost = config.to_goal_cost_gain * calc_to_goal_cost(trajectories, goal)
+    speed_cost = config.speed_cost_gain * (config.max_speed - trajectories[:, -1, 3])
+    ob_cost = config.obstacle_cost_gain * calc_obstacle_cost(trajectories, ox, oy, config)
+    return to_goal_cost + speed_cost + ob_cost
+
+def calc_cost_floor(x, ox, oy, config):
+    """
+    Lower bound on the goal plus obstacle cost of any candidate. Every rollout
+    starts at x, so its obstacle cost is at least gain / (distance to the nearest
+    obstacle); the goal cost is never negative.
+    """
+    if ox.size == 0:
+        return 0.0
+    # Same float32 operations as the planners' first rollout pose, so the bound
+    # holds at any coordinate scale
+    dx = ox - ox.dtype.type(x[0])
+    dy = oy - oy.dtype.type(x[1])
+    r2_nearest = np.min(dx * dx + dy * dy)
+    if r2_nearest == 0.0:
+        return 0.0
+    # Slack for the kernel fusing dx * dx + dy * dy into a single rounding
+    return config.obstacle_cost_gain / np.sqrt(np.float64(r2_nearest)) * (1.0 - 1e-6)
+
+def calc_obstacle_cost(trajectory, ox, oy, config):
+    """
+    Obstacle cost of a (T, 5) trajectory or of a (K, T, 5) batch of them,
+    for obstacles at (ox, oy) (see obstacle_arrays).
+    Returns inf for every trajectory that collides with an obstacle.
+    The distance math runs in the obstacles' dtype (float32 by default).
+    """
+    position = trajectory[..., 0:2].astype(ox.dtype)  # (..., T, 2)
+    dx = ox - position[..., 0, None]  # (..., T, M) obstacle offsets from the robot
+    dy = oy - position[..., 1, None]
+    r2 = dx * dx + dy * dy  # squared distances; sqrt is only taken of the minimum
 
     if config.robot_type == RobotType.rectangle:
-        yaw = trajectory[:, 2]
-        rot = np.array([[np.cos(yaw), -np.sin(yaw)], [np.sin(yaw), np.cos(yaw)]])
-        rot = np.transpose(rot, [2, 0, 1])
-        local_ob = ob[:, None] - trajectory[:, 0:2]
-        local_ob = local_ob.reshape(-1, local_ob.shape[-1])
-        local_ob = np.array([local_ob @ x for x in rot])
-        local_ob = local_ob.reshape(-1, local_ob.shape[-1])
-        upper_check = local_ob[:, 0] <= config.robot_length / 2
-        right_check = local_ob[:, 1] <= config.robot_width / 2
-        bottom_check = local_ob[:, 0] >= -config.robot_length / 2
-        left_check = local_ob[:, 1] >= -config.robot_width / 2
-        if (np.logical_and(np.logical_and(upper_check, right_check),
-                           np.logical_and(bottom_check, left_check))).any():
-            return float("Inf")
+        yaw = trajectory[..., 2]
+        c = np.cos(yaw).astype(ox.dtype)[..., None]  # (..., T, 1)
+        s = np.sin(yaw).astype(ox.dtype)[..., None]
+        # Obstacle offsets in the robot frame
+        local_x = c * dx + s * dy
+        local_y = c * dy - s * dx
+        collided = np.logical_and.reduce((local_x <= config.robot_length / 2,
+                                          local_y <= config.robot_width / 2,
+                                          local_x >= -config.robot_length / 2,
+                                          local_y >= -config.robot_width / 2)).any(axis=(-2, -1))
     elif config.robot_type == RobotType.circle:
-        if np.array(r <= config.robot_radius).any():
-            return float("Inf")
+        collided = (r2 <= config.robot_radius ** 2).any(axis=(-2, -1))
 
-    min_r = np.min(r)
-    return 1.0 / min_r
+    # With no obstacles min_r is inf and the cost is 0, as in the kernels
+    min_r = np.sqrt(np.min(r2, axis=(-2, -1), initial=np.inf))
+    # Only divide for collision-free trajectories; a colliding one may have min_r == 0
+    return np.divide(1.0, min_r, out=np.full_like(min_r, np.inf), where=~collided)
 
 def calc_to_goal_cost(trajectory, goal):
-    dx = goal[0] - trajectory[-1, 0]
-    dy = goal[1] - trajectory[-1, 1]
-    error_angle = math.atan2(dy, dx)
-    cost_angle = error_angle - trajectory[-1, 2]
-    cost = abs(math.atan2(math.sin(cost_angle), math.cos(cost_angle)))
+    """
+    1 - cos of the angle between the final heading and the direction to the goal,
+    taken from a dot product rather than atan2; it ranks headings like the angle does.
+    """
+    dx = goal[0] - trajectory[..., -1, 0]
+    dy = goal[1] - trajectory[..., -1, 1]
+    norm = np.hypot(dx, dy)
+    dot = dx * np.cos(trajectory[..., -1, 2]) + dy * np.sin(trajectory[..., -1, 2])
+    cost = 1.0 - np.divide(dot, norm, out=np.ones_like(norm), where=norm > 0)
     return cost
 
-def plot_arrow(x, y, yaw, length=0.5, width=0.1):
-    plt.arrow(x, y, length * math.cos(yaw), length * math.sin(yaw),
-              head_length=width, head_width=width)
-    plt.plot(x, y)
+# Compiled kernels. Numba cannot take Config, so they receive plain scalars
+# (see Config.kernel_params) and use explicit loops instead of array expressions.
+
+@njit
+def _motion_s(x, y, theta, v, tan_delta, dt, wheelbase):
+    """Bicycle model step on scalar state; returns the new (x, y, theta)."""
+    return (x + v * np.cos(theta) * dt,
+            y + v * np.sin(theta) * dt,
+            theta + (v / wheelbase) * tan_delta * dt)
+
+@njit
+def _arc_pose(x0, y0, theta0, v, omega, t):
+    """Pose (x, y, theta) after driving t seconds at speed v and constant yaw rate omega."""
+    half_turn = 0.5 * omega * t
+    chord = v * t * np.sinc(half_turn / np.pi)
+    return (x0 + chord * np.cos(theta0 + half_turn),
+            y0 + chord * np.sin(theta0 + half_turn),
+            theta0 + 2.0 * half_turn)
+
+@njit
+def _predict_trajectory(x_init, v, delta, dt, wheelbase, n_steps):
+    trajectory = np.empty((n_steps + 1, 5))
+    trajectory[0] = x_init
+    trajectory[1:, 3] = v
+    trajectory[1:, 4] = delta
+    omega = v * np.tan(delta) / wheelbase
+    for i in range(1, n_steps + 1):
+        trajectory[i, 0], trajectory[i, 1], trajectory[i, 2] = _arc_pose(
+            x_init[0], x_init[1], x_init[2], v, omega, i * dt)
+    return trajectory
+
+@njit
+def _rollout_and_score(x_init, v, tan_delta, gx, gy, ox, oy, params):
+    """
+    Final cost of one (v, delta) candidate. The rollout poses are evaluated one at a
+    time and scored as they go, so no trajectory array is built, and a collision
+    ends it early.
+    """
+    (dt, wheelbase, n_steps, to_goal_cost_gain, speed_cost_gain, obstacle_cost_gain,
+     max_speed, rectangle, robot_radius, robot_length, robot_width) = params
+    omega = v * tan_delta / wheelbase
+    # The obstacle loop runs in float32, like ox and oy
+    radius2 = np.float32(robot_radius * robot_radius)
+    half_length = np.float32(robot_length / 2)
+    half_width = np.float32(robot_width / 2)
+    # Obstacles farther than the rectangle's half-diagonal cannot be inside it
+    half_diagonal2 = half_length * half_length + half_width * half_width
+    min_r2 = np.float32(np.inf)
+    for t in range(n_steps + 1):
+        x, y, theta = _arc_pose(x_init[0], x_init[1], x_init[2], v, omega, t * dt)
+        px = np.float32(x)
+        py = np.float32(y)
+        if rectangle:
+            c = np.float32(np.cos(theta))
+            s = np.float32(np.sin(theta))
+        for m in range(ox.size):
+            dx = ox[m] - px
+            dy = oy[m] - py
+            r2 = dx * dx + dy * dy
+            if rectangle:
+                if r2 <= half_diagonal2:
+                    lx = dx * c + dy * s
+                    ly = -dx * s + dy * c
+                    if abs(lx) <= half_length and abs(ly) <= half_width:
+                        return np.inf
+            elif r2 <= radius2:
+                return np.inf
+            min_r2 = min(min_r2, r2)
+
+    goal_dx = gx - x
+    goal_dy = gy - y
+    norm = np.sqrt(goal_dx * goal_dx + goal_dy * goal_dy)
+    to_goal_cost = 0.0
+    if norm > 0.0:
+        to_goal_cost = 1.0 - (goal_dx * np.cos(theta) + goal_dy * np.sin(theta)) / norm
+    return (to_goal_cost_gain * to_goal_cost
+            + speed_cost_gain * (max_speed - v)
+            + obstacle_cost_gain / np.sqrt(np.float64(min_r2)))
 
-def plot_robot(x, y, yaw, config):
+@njit(parallel=True)
+def _calc_final_costs(x_init, v, tan_delta, gx, gy, ox, oy, n_first, cost_floor, params):
+    """
+    Final cost of every candidate, left at inf where the speed-cost bound proves it
+    cannot win (see calc_control_and_trajectory).
+    """
+    speed_cost_gain, max_speed = params[4], params[6]
+    n = v.size
+    final_cost = np.full(n, np.inf)
+    # Every (v, delta) rollout is independent, so the candidates are split across threads
+    for k in prange(n - n_first, n):
+        final_cost[k] = _rollout_and_score(x_init, v[k], tan_delta[k], gx, gy, ox, oy, params)
+    if n_first < n:
+        min_cost = final_cost[n - n_first:].min()
+        for k in prange(n - n_first):
+            if speed_cost_gain * (max_speed - v[k]) + cost_floor <= min_cost:
+                final_cost[k] = _rollout_and_score(x_init, v[k], tan_delta[k], gx, gy, ox, oy,
+                                                   params)
+    return final_cost
+
+def robot_outline(x, y, yaw, config):
+    """
+    Line points drawn for the robot: the body outline for a rectangle,
+    the heading radius for a circle.
+    """
     if config.robot_type == RobotType.rectangle:
         outline = np.array([[-config.robot_length / 2, config.robot_length / 2,
                              config.robot_length / 2, -config.robot_length / 2,
@@ -168,14 +474,42 @@ def plot_robot(x, y, yaw, config):
         outline = (outline.T.dot(Rot1)).T
         outline[0, :] += x
         outline[1, :] += y
-        plt.plot(np.array(outline[0, :]).flatten(),
-                 np.array(outline[1, :]).flatten(), "-k")
-    elif config.robot_type == RobotType.circle:
-        circle = plt.Circle((x, y), config.robot_radius, color="b")
-        plt.gcf().gca().add_artist(circle)
-        out_x, out_y = (np.array([x, y]) +
-                        np.array([np.cos(yaw), np.sin(yaw)]) * config.robot_radius)
-        plt.plot([x, out_x], [y, out_y], "-k")
+        return outline[0, :], outline[1, :]
+    out_x, out_y = (np.array([x, y]) +
+                    np.array([np.cos(yaw), np.sin(yaw)]) * config.robot_radius)
+    return [x, out_x], [y, out_y]
+
+def init_plot(x, goal, ob, config, arrow_width=0.1):
+    """
+    Draw the static scene once and create the artists that update_plot moves.
+    """
+    plt.cla()
+    plt.gcf().canvas.mpl_connect('key_release_event',
+                                 lambda event: [exit(0) if event.key == 'escape' else None])
+    artists = {"predicted": plt.plot([], [], "-g")[0],
+               "position": plt.plot([], [], "xr")[0]}
+    plt.plot(goal[0], goal[1], "xb")
+    plt.plot(ob[:, 0], ob[:, 1], "ok")
+    if config.robot_type == RobotType.circle:
+        artists["body"] = plt.gca().add_patch(plt.Circle((x[0], x[1]), config.robot_radius, color="b"))
+    artists["outline"] = plt.plot([], [], "-k")[0]
+    artists["arrow"] = plt.arrow(x[0], x[1], 0.0, 0.0,
+                                 head_length=arrow_width, head_width=arrow_width)
+    plt.axis("equal")
+    plt.grid(True)
+    return artists
+
+def update_plot(artists, x, predicted_trajectory, config, arrow_length=0.5):
+    artists["predicted"].set_data(predicted_trajectory[:, 0], predicted_trajectory[:, 1])
+    artists["position"].set_data([x[0]], [x[1]])
+    if "body" in artists:
+        artists["body"].center = (x[0], x[1])
+    artists["outline"].set_data(*robot_outline(x[0], x[1], x[2], config))
+    artists["arrow"].set_data(x=x[0], y=x[1],
+                              dx=arrow_length * math.cos(x[2]), dy=arrow_length * math.sin(x[2]))
+    plt.gca().relim()
+    plt.gca().autoscale_view()
+    plt.pause(0.0001)
 
 def main(gx=10.0, gy=10.0, robot_type=RobotType.circle):
     #print(__file__ + " start!!")
@@ -184,34 +518,29 @@ def main(gx=10.0, gy=10.0, robot_type=RobotType.circle):
     goal = np.array([gx, gy])
 
     config.robot_type = robot_type
-    trajectory = np.array(x)
+    trajectory = [x]
     ob = config.ob
+    if show_animation:
+        artists = init_plot(x, goal, ob, config)
 
+    step = 0
     while True:
         u, predicted_trajectory = dwa_control(x, config, goal, ob)
-        x = motion(x, u, config.dt, config.wheelbase)  # Simulate with bicycle model
-        trajectory = np.vstack((trajectory, x))
-
-        if show_animation:
-            plt.cla()
-            plt.gcf().canvas.mpl_connect('key_release_event',
-                                         lambda event: [exit(0) if event.key == 'escape' else None])
-            plt.plot(predicted_trajectory[:, 0], predicted_trajectory[:, 1], "-g")
-            plt.plot(x[0], x[1], "xr")
-            plt.plot(goal[0], goal[1], "xb")
-            plt.plot(ob[:, 0], ob[:, 1], "ok")
-            plot_robot(x[0], x[1], x[2], config)
-            plot_arrow(x[0], x[1], x[2])
-            plt.axis("equal")
-            plt.grid(True)
-            plt.pause(0.0001)
+        x = motion(x, u[0], u[1], config.dt, config.wheelbase)  # Simulate with bicycle model
+        trajectory.append(x)
+        step += 1
 
         dist_to_goal = math.hypot(x[0] - goal[0], x[1] - goal[1])
-        if dist_to_goal <= config.robot_radius:
+        at_goal = dist_to_goal <= config.robot_radius
+        if show_animation and (at_goal or step % config.render_every == 0):
+            update_plot(artists, x, predicted_trajectory, config)
+
+        if at_goal:
             print("Goal!!")
             break
 
     print("Done")
+    trajectory = np.asarray(trajectory)
     if show_animation:
         plt.plot(trajectory[:, 0], trajectory[:, 1], "-r")
         plt.pause(0.0001)